@@ -1,5 +1,17 @@
 import itertools
+import logging
 import random
+from collections import deque
+
+import numpy as np
+
+# numba is optional, without it the AI falls back to pure Python inference
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+log = logging.getLogger(__name__)
 
 
 class Minesweeper():
@@ -15,20 +27,31 @@ class Minesweeper():
         self.mines = set()
 
         # Initialize an empty field with no mines
-        self.board = []
-        for i in range(self.height):
-            row = []
-            for j in range(self.width):
-                row.append(False)
-            self.board.append(row)
+        self.board = np.zeros((height, width), dtype=np.uint8)
 
         # Add mines randomly
         while len(self.mines) != mines:
             i = random.randrange(height)
             j = random.randrange(width)
-            if not self.board[i][j]:
+            if not self.board[i, j]:
                 self.mines.add((i, j))
-                self.board[i][j] = True
+                self.board[i, j] = 1
+
+        # Boards that fit in 64 bits also keep the mines and each cell's
+        # neighbors as bitmasks, so nearby_mines is a single popcount
+        self._mine_mask = None
+        self._nbr_mask = None
+        if height * width <= 64:
+            self._mine_mask = 0
+            for i, j in self.mines:
+                self._mine_mask |= 1 << (i * width + j)
+            self._nbr_mask = [0] * (height * width)
+            for i in range(height):
+                for j in range(width):
+                    for ni in range(max(0, i - 1), min(height, i + 2)):
+                        for nj in range(max(0, j - 1), min(width, j + 2)):
+                            if (ni, nj) != (i, j):
+                                self._nbr_mask[i * width + j] |= 1 << (ni * width + nj)
 
         # At first, player has found no mines
         self.mines_found = set()
@@ -41,7 +64,7 @@ class Minesweeper():
         for i in range(self.height):
             print("--" * self.width + "-")
             for j in range(self.width):
-                if self.board[i][j]:
+                if self.board[i, j]:
                     print("|X", end="")
                 else:
                     print("| ", end="")
@@ -50,7 +73,7 @@ class Minesweeper():
 
     def is_mine(self, cell):
         i, j = cell
-        return self.board[i][j]
+        return bool(self.board[i, j])
 
     def nearby_mines(self, cell):
         """
@@ -58,30 +81,171 @@ class Minesweeper():
         within one row and column of a given cell,
         not including the cell itself.
         """
+        i, j = cell
+        if self._nbr_mask is not None:
+            return (self._mine_mask & self._nbr_mask[i * self.width + j]).bit_count()
 
-        # Keep count of nearby mines
-        count = 0
+        # Sum the in-bounds 3x3 block around the cell, then ignore the cell itself
+        block = self.board[max(0, i - 1):min(self.height, i + 2), max(0, j - 1):min(self.width, j + 2)]
+        return int(block.sum()) - int(self.board[i, j])
 
-        # Loop over all cells within one row and column
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
+    def won(self):
+        """
+        Checks if all mines have been flagged.
+        """
+        return self.mines_found == self.mines
 
-                # Ignore the cell itself
-                if (i, j) == cell:
-                    continue
 
-                # Update count if cell in bounds and is mine
-                if 0 <= i < self.height and 0 <= j < self.width:
-                    if self.board[i][j]:
-                        count += 1
+def iter_bits(mask):
+    """
+    Yields the index of every bit set in a cell bitmask.
+    """
+    while mask:
+        bit = mask & -mask
+        yield bit.bit_length() - 1
+        mask ^= bit
 
-        return count
 
-    def won(self):
+def iter_cells(mask, width):
+    """
+    Yields the (i, j) cell for every bit set in a cell bitmask.
+    """
+    for index in iter_bits(mask):
+        yield divmod(index, width)
+
+
+if njit is not None:
+
+    # Explicit signatures make numba compile (or load from its on-disk cache)
+    # at import time, instead of stalling the first add_knowledge call
+
+    @njit("int64(uint64)", cache=True)
+    def _popcount(mask):
         """
-        Checks if all mines have been flagged.
+        Returns the number of bits set in a uint64 mask.
         """
-        return self.mines_found == self.mines
+        n = 0
+        while mask:
+            mask &= mask - np.uint64(1)
+            n += 1
+        return n
+
+    @njit("Tuple((uint64[:], int8[:], uint64, uint64))(uint64[:], int8[:], boolean[:])", cache=True)
+    def _resolve(masks, counts, alive):
+        """
+        Compiled version of the resolution and inference loop in
+        MinesweeperAI.add_knowledge, for boards of at most 64 cells.
+
+        Sentences are given as parallel arrays of cell masks, mine counts
+        and alive flags. Returns the masks and counts of the sentences left
+        unresolved, followed by the masks of every cell found to be safe
+        and every cell found to be a mine.
+        """
+        zero = np.uint64(0)
+        n = masks.shape[0]
+        capacity = 2 * n + 8
+        m = np.zeros(capacity, dtype=np.uint64)
+        c = np.zeros(capacity, dtype=np.int8)
+        live = np.zeros(capacity, dtype=np.bool_)
+        m[:n] = masks
+        c[:n] = counts
+        live[:n] = alive
+
+        safes = zero
+        mines = zero
+        changed = True
+        while changed:
+            changed = False
+            # 4) look for new leads, dropping cells already known about
+            for i in range(n):
+                if not live[i]:
+                    continue
+                known = m[i] & mines
+                if known != zero:
+                    c[i] -= _popcount(known)
+                m[i] &= ~(mines | safes)
+                if m[i] == zero:
+                    live[i] = False
+                elif c[i] == 0:
+                    safes |= m[i]
+                    live[i] = False
+                    changed = True
+                elif _popcount(m[i]) <= c[i]:
+                    mines |= m[i]
+                    live[i] = False
+                    changed = True
+            # 5) Inference new sentences
+            end = n
+            for a in range(end):
+                if not live[a]:
+                    continue
+                for b in range(a + 1, end):
+                    if not live[b]:
+                        continue
+                    am = m[a]
+                    bm = m[b]
+                    if am == bm:
+                        continue
+                    ab = am & ~bm
+                    ba = bm & ~am
+                    if ba == zero and c[a] > c[b]:
+                        new_mask = ab
+                        new_count = c[a] - c[b]
+                    elif ab == zero and c[b] > c[a]:
+                        new_mask = ba
+                        new_count = c[b] - c[a]
+                    else:
+                        continue
+                    duplicate = False
+                    for k in range(n):
+                        if live[k] and m[k] == new_mask and c[k] == new_count:
+                            duplicate = True
+                            break
+                    if duplicate:
+                        continue
+                    if n == capacity:
+                        capacity *= 2
+                        grown_m = np.zeros(capacity, dtype=np.uint64)
+                        grown_c = np.zeros(capacity, dtype=np.int8)
+                        grown_live = np.zeros(capacity, dtype=np.bool_)
+                        grown_m[:n] = m[:n]
+                        grown_c[:n] = c[:n]
+                        grown_live[:n] = live[:n]
+                        m = grown_m
+                        c = grown_c
+                        live = grown_live
+                    m[n] = new_mask
+                    c[n] = new_count
+                    live[n] = True
+                    n += 1
+                    changed = True
+            # 5b) drop sentences subsumed by a smaller one
+            for a in range(n):
+                if not live[a] or m[a] == zero:
+                    continue
+                am = m[a]
+                for b in range(n):
+                    if b == a or not live[b] or (m[b] & am) != am:
+                        continue
+                    if m[b] == am:
+                        if b > a and c[b] == c[a]:
+                            live[b] = False
+                        continue
+                    rest = m[b] & ~am
+                    if c[b] == c[a]:
+                        safes |= rest
+                        live[b] = False
+                        changed = True
+                    elif c[b] - c[a] == _popcount(rest):
+                        mines |= rest
+                        live[b] = False
+                        changed = True
+
+        keep = live[:n]
+        return m[:n][keep], c[:n][keep], safes, mines
+
+else:
+    _resolve = None
 
 
 class Sentence():
@@ -89,34 +253,56 @@ class Sentence():
     Logical statement about a Minesweeper game
     A sentence consists of a set of board cells,
     and a count of the number of those cells which are mines.
+
+    Cells are stored as an integer bitmask, with the bit at
+    index i * width + j standing for cell (i, j).
     """
 
-    def __init__(self, cells, count):
-        self.cells = set(cells)
+    def __init__(self, cells_mask, count, width):
+        self.cells_mask = cells_mask
+        self.n_cells = cells_mask.bit_count()
         self.count = count
+        self.width = width
+        # Hashable (cells_mask, count) pair identifying this sentence,
+        # kept in step with cells_mask and count by mark_mine and mark_safe
+        self.key = (cells_mask, count)
+        # Cleared once the sentence has been resolved and is waiting to be dropped
+        self.alive = True
 
     def __eq__(self, other):
-        return self.cells == other.cells and self.count == other.count
+        return self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
 
     def __str__(self):
         return f"{self.cells} = {self.count}"
 
+    @property
+    def cells(self):
+        """
+        Returns the set of (i, j) cells in this sentence.
+        """
+        return set(iter_cells(self.cells_mask, self.width))
+
     def known_mines(self):
         """
-        Returns the set of all cells in self.cells known to be mines.
+        Returns the bitmask of all cells in self.cells known to be mines,
+        or None if they are not known. Use iter_cells to walk the result.
         """
 
         # Check if the number of cells is equal to the count of mines - if so, return known mines
-        if len(self.cells) <= self.count:
-            return self.cells.copy()
+        if self.n_cells <= self.count:
+            return self.cells_mask
         return None
 
     def known_safes(self):
         """
-        Returns the set of all cells in self.cells known to be safe.
+        Returns the bitmask of all cells in self.cells known to be safe,
+        or None if they are not known. Use iter_cells to walk the result.
         """
         if self.count == 0:
-            return self.cells.copy()
+            return self.cells_mask
         return None
 
     def mark_mine(self, cell):
@@ -124,12 +310,15 @@ class Sentence():
         Updates internal knowledge representation given the fact that
         a cell is known to be a mine.
         """
+        bit = 1 << (cell[0] * self.width + cell[1])
         # check if cell is in sentence
-        if cell in self.cells:
+        if self.cells_mask & bit:
             # reduce known mine count
             self.count -= 1
             # remove cell
-            self.cells.remove(cell)
+            self.cells_mask &= ~bit
+            self.n_cells -= 1
+            self.key = (self.cells_mask, self.count)
         return
 
     def mark_safe(self, cell):
@@ -137,10 +326,13 @@ class Sentence():
         Updates internal knowledge representation given the fact that
         a cell is known to be safe.
         """
+        bit = 1 << (cell[0] * self.width + cell[1])
         # check if cell in sentence
-        if cell in self.cells:
+        if self.cells_mask & bit:
             # remove cell
-            self.cells.remove(cell)
+            self.cells_mask &= ~bit
+            self.n_cells -= 1
+            self.key = (self.cells_mask, self.count)
         return
 
 
@@ -155,33 +347,131 @@ class MinesweeperAI():
         self.height = height
         self.width = width
 
-        # Keep track of which cells have been clicked on
-        self.moves_made = set()
+        # Flattened indices (i * width + j) of the in-bounds neighbors of every cell
+        self._neighbors = [
+            tuple(
+                ni * width + nj
+                for ni in range(max(0, i - 1), min(height, i + 2))
+                for nj in range(max(0, j - 1), min(width, j + 2))
+                if (ni, nj) != (i, j)
+            )
+            for i in range(height)
+            for j in range(width)
+        ]
 
-        # Keep track of cells known to be safe or mines
-        self.mines = set()
-        self.safes = set()
+        # Bitmask with a bit set for every cell on the board
+        self.all_mask = (1 << (height * width)) - 1
+
+        # Keep track of which cells have been clicked on, as a bitmask
+        self.moves_mask = 0
+
+        # Keep track of cells known to be safe or mines, as bitmasks
+        self.mines_mask = 0
+        self.safes_mask = 0
 
         # List of sentences about the game known to be true
         self.knowledge = []
+        # Keys of the sentences in self.knowledge, for constant time duplicate checks
+        self._knowledge_keys = set()
+        # Positions in self.knowledge of the sentences containing each cell index
+        self._cell_to_sentences = {}
+
+    @property
+    def moves_made(self):
+        """
+        Returns the set of cells that have been clicked on.
+        """
+        return set(iter_cells(self.moves_mask, self.width))
+
+    @property
+    def mines(self):
+        """
+        Returns the set of cells known to be mines.
+        """
+        return set(iter_cells(self.mines_mask, self.width))
+
+    @property
+    def safes(self):
+        """
+        Returns the set of cells known to be safe.
+        """
+        return set(iter_cells(self.safes_mask, self.width))
+
+    def _add_sentence(self, sentence):
+        """
+        Adds a sentence to the knowledge base unless an equal one is
+        already known. Returns True if the sentence was added.
+        """
+        key = sentence.key
+        if key in self._knowledge_keys:
+            return False
+        self._knowledge_keys.add(key)
+        self._index_sentence(sentence, len(self.knowledge))
+        self.knowledge.append(sentence)
+        return True
+
+    def _index_sentence(self, sentence, position):
+        """
+        Records the sentence at the given position of self.knowledge
+        against every cell it contains.
+        """
+        for index in iter_bits(sentence.cells_mask):
+            self._cell_to_sentences.setdefault(index, []).append(position)
+
+    def _remove_sentence(self, sentence):
+        """
+        Marks a sentence as dead. Dead sentences are skipped by all
+        knowledge updates and dropped by _compact_knowledge.
+        """
+        sentence.alive = False
+        self._knowledge_keys.discard(sentence.key)
+
+    def _compact_knowledge(self):
+        """
+        Drops every dead sentence from the knowledge base in a single pass.
+        """
+        self.knowledge = [sentence for sentence in self.knowledge if sentence.alive]
+        self._cell_to_sentences = {}
+        for position, sentence in enumerate(self.knowledge):
+            self._index_sentence(sentence, position)
 
     def mark_mine(self, cell):
         """
         Marks a cell as a mine, and updates all knowledge
         to mark that cell as a mine as well.
         """
-        self.mines.add(cell)
+        self.mines_mask |= 1 << (cell[0] * self.width + cell[1])
         for sentence in self.knowledge:
+            if not sentence.alive:
+                continue
+            key = sentence.key
             sentence.mark_mine(cell)
+            if sentence.key != key:
+                self._knowledge_keys.discard(key)
+                if sentence.key in self._knowledge_keys:
+                    # now a duplicate of another known sentence
+                    sentence.alive = False
+                else:
+                    self._knowledge_keys.add(sentence.key)
 
     def mark_safe(self, cell):
         """
         Marks a cell as safe, and updates all knowledge
         to mark that cell as safe as well.
         """
-        self.safes.add(cell)
+        self.safes_mask |= 1 << (cell[0] * self.width + cell[1])
         for sentence in self.knowledge:
+            if not sentence.alive:
+                continue
+            key = sentence.key
             sentence.mark_safe(cell)
+            if sentence.key != key:
+                self._knowledge_keys.discard(key)
+                if sentence.key in self._knowledge_keys:
+                    # now a duplicate of another known sentence
+                    sentence.alive = False
+                else:
+                    self._knowledge_keys.add(sentence.key)
 
     def add_knowledge(self, cell, count):
         """
@@ -201,78 +491,136 @@ class MinesweeperAI():
                if they can be inferred from existing knowledge
         """
         # 1) add cell to self.moves
-        self.moves_made.add(cell)
+        self.moves_mask |= 1 << (cell[0] * self.width + cell[1])
         # 2) mark as safe
         self.mark_safe(cell)
 
         # 3) create a new sentence
-        newCells = set()
+        newMask = 0
 
         # 3a) Find all empty cells around this cell
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
-                # skip instances that are off of the board
-                if i < 0 or i > self.height-1 or j < 0 or j > self.width - 1:
-                    continue
-                locationToTest = (i, j)
-                if locationToTest == cell:
-                    continue
-                if locationToTest not in self.moves_made and locationToTest not in self.mines and locationToTest not in self.safes:
-                    newCells.add(locationToTest)
+        minesMask = self.mines_mask
+        knownMask = self.moves_mask | self.safes_mask | minesMask
+        for index in self._neighbors[cell[0] * self.width + cell[1]]:
+            bit = 1 << index
+            if knownMask & bit:
+                # known mines are left out of the sentence, so take them off the count
+                if minesMask & bit:
+                    count -= 1
+                continue
+            newMask |= bit
         # 3b) if there are empty cells near this cell add a new sentence to knowledge base
-        if len(newCells) != 0:
-            newSentence = Sentence(newCells, count)
-            self.knowledge.append(newSentence)
-            print("new sentence added")
-            print(newCells, count)
-
-        ## Cycle through all known knowledge seeing if any sentences became resolved by new data.
-        ## Each time something is resolved it could have knock on effects, so cycle through all sencents again.
-        cycles = 1
-        while cycles > 0:
+        if newMask != 0:
+            newSentence = Sentence(newMask, count, self.width)
+            if self._add_sentence(newSentence):
+                log.debug("new sentence added: %s", newSentence)
+
+        # With numba available, run steps 4 and 5 as compiled code
+        if _resolve is not None and self.height * self.width <= 64:
+            self._resolve_knowledge()
+            return
+
+        ## Work through the sentences that may lead somewhere: at first all of them,
+        ## then any sentence that is new or was changed by a cell being resolved.
+        knowledge = self.knowledge
+        cellToSentences = self._cell_to_sentences
+        worklist = deque(range(len(knowledge)))
+        queued = set(worklist)
+        while worklist:
+            a = worklist.popleft()
+            queued.discard(a)
+            sentenceA = knowledge[a]
+            if not sentenceA.alive:
+                continue
+
             # 4) look for new leads
-            for sentence in self.knowledge:
-                safes = sentence.known_safes()
-                if safes != None:
-                    for cell in safes:
-                        print("marking safe cells from sentence:", sentence)
-                        self.mark_safe(cell)
-                    cycles = 2
-                    self.knowledge.remove(sentence)
-                else:
-                    mines = sentence.known_mines()
-                    if mines != None:
-                        print("marking known mines from sentence:", sentence)
-                        for cell in mines:
-                            self.mark_mine(cell)
-                        self.knowledge.remove(sentence)
-                        cycles = 2
+            resolved = sentenceA.known_safes()
+            isMine = False
+            if resolved is None:
+                resolved = sentenceA.known_mines()
+                isMine = True
+            if resolved is not None:
+                log.debug("resolving cells from sentence: %s", sentenceA)
+                self._remove_sentence(sentenceA)
+                self._resolve_cells(resolved, isMine, worklist, queued)
+                continue
+
             # 5) Inference new sentences
-            for sentenceA in self.knowledge:
-                for sentenceB in self.knowledge:
-                    if sentenceA == sentenceB:
-                        continue
-                    if len(sentenceA.cells) == 0 or len(sentenceB.cells) == 0:
-                        continue
-                    AB = sentenceA.cells - sentenceB.cells
-                    BA = sentenceB.cells - sentenceA.cells
-                    if len(BA) == 0:
-                        if len(AB) != 0:
-                            if sentenceA.count - sentenceB.count > 0:
-                                newSentence = Sentence(AB, sentenceA.count - sentenceB.count)
-                                if newSentence not in self.knowledge:
-                                    print("sentence inferred", newSentence)
-                                    self.knowledge.append(newSentence)
-                                    cycles = 2
-                    if len(AB) == 0:
-                        if len(BA) != 0:
-                            if sentenceB.count - sentenceA.count > 0:
-                                newSentence = Sentence(BA, sentenceB.count - sentenceA.count)
-                                if newSentence not in self.knowledge:
-                                    print("sentence inferred", newSentence)
-                                    self.knowledge.append(newSentence)
-                                    cycles = 2
-            cycles -= 1
+            # Only sentences sharing a cell with sentenceA can give an inference.
+            am = sentenceA.cells_mask
+            candidates = {
+                b
+                for index in iter_bits(am)
+                for b in cellToSentences[index]
+                if b != a
+            }
+            for b in candidates:
+                sentenceB = knowledge[b]
+                if not sentenceB.alive:
+                    continue
+                bm = sentenceB.cells_mask
+                # equal cell sets leave nothing to infer
+                if am == bm or bm == 0:
+                    continue
+                if (am & bm) == bm:
+                    superset, subset = sentenceA, sentenceB
+                elif (am & bm) == am:
+                    superset, subset = sentenceB, sentenceA
+                else:
+                    continue
+                # the cells of superset - subset hold the difference in their counts
+                rest = superset.cells_mask & ~subset.cells_mask
+                difference = superset.count - subset.count
+                if difference == 0 or difference == rest.bit_count():
+                    # rest is resolved and superset adds nothing over subset
+                    log.debug("resolving cells from subsumed sentence: %s", superset)
+                    self._remove_sentence(superset)
+                    self._resolve_cells(rest, difference != 0, worklist, queued)
+                elif difference > 0:
+                    newSentence = Sentence(rest, difference, self.width)
+                    if self._add_sentence(newSentence):
+                        log.debug("sentence inferred: %s", newSentence)
+                        worklist.append(len(knowledge) - 1)
+                        queued.add(len(knowledge) - 1)
+                if not sentenceA.alive:
+                    break
+        self._compact_knowledge()
+
+    def _resolve_cells(self, mask, isMine, worklist, queued):
+        """
+        Marks every cell in mask as a mine or as safe, and queues
+        each sentence that contained one of those cells.
+        """
+        for index in iter_bits(mask):
+            if isMine:
+                self.mark_mine(divmod(index, self.width))
+            else:
+                self.mark_safe(divmod(index, self.width))
+            for position in self._cell_to_sentences[index]:
+                if position not in queued and self.knowledge[position].alive:
+                    worklist.append(position)
+                    queued.add(position)
+
+    def _resolve_knowledge(self):
+        """
+        Runs steps 4 and 5 of add_knowledge through the compiled _resolve
+        kernel, then rebuilds the knowledge base from its results.
+        """
+        n = len(self.knowledge)
+        masks = np.fromiter((sentence.cells_mask for sentence in self.knowledge), dtype=np.uint64, count=n)
+        counts = np.fromiter((sentence.count for sentence in self.knowledge), dtype=np.int8, count=n)
+        alive = np.ones(n, dtype=np.bool_)
+        masks, counts, safes, mines = _resolve(masks, counts, alive)
+
+        self.knowledge = []
+        self._knowledge_keys = set()
+        self._cell_to_sentences = {}
+        for mask, count in zip(masks.tolist(), counts.tolist()):
+            self._add_sentence(Sentence(mask, count, self.width))
+        for cell in iter_cells(int(safes), self.width):
+            self.mark_safe(cell)
+        for cell in iter_cells(int(mines), self.width):
+            self.mark_mine(cell)
 
     def make_safe_move(self):
         """
@@ -283,11 +631,11 @@ class MinesweeperAI():
         This function may use the knowledge in self.mines, self.safes
         and self.moves_made, but should not modify any of those values.
         """
-        availableSafeMoves = self.safes - self.moves_made - self.mines
-        if len(availableSafeMoves) == 0:
+        availableSafeMoves = self.safes_mask & ~self.moves_mask & ~self.mines_mask
+        if availableSafeMoves == 0:
             return None
-        safeMove = availableSafeMoves.pop()
-        return safeMove
+        safeMove = availableSafeMoves & -availableSafeMoves
+        return divmod(safeMove.bit_length() - 1, self.width)
 
 
     def make_random_move(self):
@@ -298,15 +646,11 @@ class MinesweeperAI():
             2) are not known to be mines
         """
 
-        # Generate all options
-        allMoves = set()
-        for i in range(self.height):
-            for j in range(self.width):
-                allMoves.add((i,j))
-        availableMoves = allMoves - self.mines - self.moves_made
-        if len(availableMoves) == 0:
+        availableMoves = self.all_mask & ~self.moves_mask & ~self.mines_mask
+        if availableMoves == 0:
             return None
-        randomMove = availableMoves.pop()
-        return randomMove
+
+        # Pick uniformly among the available cells
+        return random.choice(list(iter_cells(availableMoves, self.width)))
         
         